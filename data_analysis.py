@@ -1,63 +1,45 @@
 ﻿# streamlit dashboard for cafe feedback
+import os
 import re
+import tempfile
 from datetime import date
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import streamlit as st
 
 DATA_FILE = "Sample data - Cafe - Sample data 2400 records.csv"
-
-
-# Load and clean data -------------------------------------------------------
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]  # drop empty cols
-
-    # Standardise location strings to merge trailing/duplicate whitespace
-    df["Location"] = (
-        df["Location"]
-        .astype(str)
-        .str.strip()
-        .str.replace(r"\s+", " ", regex=True)
-    )
-
-    # Clean numerical fields
-    df["Rating"] = pd.to_numeric(df["Rating"], errors="coerce")
-
-    def parse_value(x):
-        """Accept only currency-like numbers within a realistic range."""
-        if pd.isna(x):
-            return None
-        s = str(x).strip()
-        m = re.search(r"-?\$?\s*([0-9]{1,3}(?:,[0-9]{3})*|[0-9]+)(?:\.[0-9]{1,2})?", s)
-        if not m:
-            return None
-        try:
-            val = float(re.sub(r"[,$]", "", m.group()))
-        except ValueError:
-            return None
-        if val <= 0 or val > 500:
-            return None
-        return val
-
-    df["Transaction Value"] = df["Transaction Value"].apply(parse_value)
-    df["Transaction Date and Time"] = pd.to_datetime(
-        df["Transaction Date and Time"], dayfirst=True, errors="coerce"
-    )
-    df["Date"] = df["Transaction Date and Time"].dt.date
-    df.dropna(subset=["Rating", "Transaction Value"], inplace=True)
-
-    if "Comment" not in df.columns:
-        df["Comment"] = ""
-
-    df["DayName"] = df["Transaction Date and Time"].dt.day_name()
-    return df.reset_index(drop=True)
-
-
-def top_words(series: pd.Series, n: int = 12):
-    stop_words = {
+CLEAN_FILE = "cleaned.parquet"  # cleaned-data cache, written next to the CSV
+CSV_COLUMNS = [
+    "Location",
+    "Rating",
+    "Comment",
+    "Transaction Date and Time",
+    "Transaction Value",
+    "feedback_id",
+]
+RATING_STEPS = 2  # ratings are stored as int8 half-star codes (rating * 2)
+DAY_NAMES = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+# Patterns are compiled once here rather than per call/row
+_SPACE_RE = re.compile(r"\s+")
+_STRIP_RE = re.compile(r"[,$\s]")  # currency noise around transaction values
+_MONEY_RE = re.compile(r"(-?\d+(?:\.\d{1,2})?)")
+_WORD_RE = re.compile(r"[a-zA-Z']+")
+_STOP = frozenset(
+    {
         "the",
         "and",
         "to",
@@ -96,35 +78,230 @@ def top_words(series: pd.Series, n: int = 12):
         "us",
         "had",
     }
+)
+
+
+# Load and clean data -------------------------------------------------------
+@st.cache_data
+def load_data(path: str) -> pd.DataFrame:
+    """Return the cleaned dataset, re-cleaning the CSV only when it changed."""
+    clean_path = os.path.join(os.path.dirname(path), CLEAN_FILE)
+    # Editing the cleaning code also invalidates the sidecar
+    source_mtime = max(os.path.getmtime(path), os.path.getmtime(__file__))
+    if (
+        os.path.exists(clean_path)
+        and os.path.getmtime(clean_path) >= source_mtime
+    ):
+        return pd.read_parquet(clean_path)
+
+    df = clean_csv(path)
+    # Write to a temp file and swap it in, so a concurrent cold start never
+    # reads a half-written sidecar.
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f"{CLEAN_FILE}.",
+            suffix=".tmp",
+            dir=os.path.dirname(clean_path) or ".",
+        )
+    except OSError:
+        return df  # read-only deployments simply re-clean on each cold start
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, clean_path)
+    except OSError:
+        os.remove(tmp_path)
+    return df
+
+
+def clean_csv(path: str) -> pd.DataFrame:
+    # Arrow's multi-threaded reader, limited to the columns we use. Comments
+    # contain quoted newlines; everything is read as text and cleaned below.
+    # A missing column (e.g. no Comment) comes back as nulls.
+    table = pacsv.read_csv(
+        path,
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=CSV_COLUMNS,
+            include_missing_columns=True,
+            column_types={col: pa.string() for col in CSV_COLUMNS},
+        ),
+    )
+    df = table.to_pandas()
+
+    # Standardise location strings to merge trailing/duplicate whitespace
+    df["Location"] = (
+        df["Location"]
+        .astype(str)
+        .str.strip()
+        .str.replace(_SPACE_RE, " ", regex=True)
+    )
+
+    # Clean numerical fields
+    df["Rating"] = pd.to_numeric(df["Rating"], errors="coerce")
+
+    # Accept only currency-like numbers within a realistic range
+    value = (
+        df["Transaction Value"]
+        .astype(str)
+        .str.replace(_STRIP_RE, "", regex=True)
+        .str.extract(_MONEY_RE, expand=False)
+    )
+    value = pd.to_numeric(value, errors="coerce")
+    df["Transaction Value"] = value.where((value > 0) & (value <= 500))
+    df["Transaction Date and Time"] = pd.to_datetime(
+        df["Transaction Date and Time"],
+        format="%d/%m/%Y %I:%M:%S %p",  # day-first, e.g. 19/10/2024 6:03:00 AM
+        errors="coerce",
+    )
+    df["Date"] = df["Transaction Date and Time"].dt.normalize()  # stays datetime64
+    # Keep only rows the sidebar can select: a parsed timestamp (unparseable
+    # ones are misaligned records and would leave null bucket keys) and a
+    # rating on the 1-5 slider.
+    df = df[
+        df["Rating"].between(1, 5)
+        & df["Transaction Value"].notna()
+        & df["Transaction Date and Time"].notna()
+    ].copy()
+
+    # Compact rating storage; divide by RATING_STEPS for display
+    df["Rating"] = (df["Rating"] * RATING_STEPS).round().astype("int8")
+
+    df["DayName"] = df["Transaction Date and Time"].dt.day_name()
+
+    # Low-cardinality keys: categorical codes make groupby/isin cheaper
+    df["Location"] = df["Location"].astype("category")
+    df["DayName"] = df["DayName"].astype(
+        pd.CategoricalDtype(categories=DAY_NAMES, ordered=True)
+    )
+    return df.reset_index(drop=True)
 
-    counts = {}
-    for c in series.dropna().astype(str):
-        words = re.findall(r"[a-zA-Z']+", c.lower())
-        for w in words:
-            if w not in stop_words and len(w) > 1:
-                counts[w] = counts.get(w, 0) + 1
-    top_items = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:n]
-    if not top_items:
-        return [], []
-    words, freq = zip(*top_items)
-    return words, freq
+
+@st.cache_data
+def top_words(series: pd.Series, n: int = 12):
+    # One regex scan over a single joined buffer instead of one per comment;
+    # the newline separator can never be part of a token.
+    text = series.dropna().astype(str).str.cat(sep="\n").lower()
+    tokens = pd.Series(_WORD_RE.findall(text), dtype=object)
+    tokens = tokens[(tokens.str.len() > 1) & ~tokens.isin(_STOP)]
+    # Stable sort so tied words keep their first-seen order
+    top_items = (
+        tokens.value_counts(sort=False)
+        .sort_values(ascending=False, kind="stable")
+        .head(n)
+    )
+    return top_items.index.tolist(), top_items.values.tolist()
+
+
+# Aggregations -------------------------------------------------------------
+SUMMARY_KEYS = ["Location", "Date", "Rating", "DayName"]
+
+
+@st.cache_data
+def precompute(df_full: pd.DataFrame) -> pd.DataFrame:
+    """Bucket the full dataset once by every filter/chart key.
+
+    Charts re-aggregate the (much smaller) bucket table instead of the raw
+    rows; means are derived from the sums and counts. Rating is a key, so
+    its per-bucket sum is simply n * Rating (see rollup).
+    """
+    return df_full.groupby(SUMMARY_KEYS, observed=True, sort=False).agg(
+        n=("Transaction Value", "size"),
+        txn_sum=("Transaction Value", "sum"),
+    )
+
+
+def slice_summary(
+    summary: pd.DataFrame, locations, rating_range, date_range=None
+) -> pd.DataFrame:
+    """Apply the sidebar filters to the pre-aggregated buckets."""
+    rating = summary.index.get_level_values("Rating")
+    mask = (rating >= rating_range[0]) & (rating <= rating_range[1])
+    if locations:
+        mask &= summary.index.get_level_values("Location").isin(locations)
+    if date_range is not None:
+        dates = summary.index.get_level_values("Date")
+        mask &= (dates >= date_range[0]) & (dates <= date_range[1])
+    return summary.loc[mask]
+
+
+def rollup(summary: pd.DataFrame, by: str) -> pd.DataFrame:
+    rating = summary.index.get_level_values("Rating").to_numpy()
+    totals = (
+        summary.assign(rating_sum=summary["n"].to_numpy() * rating)
+        .groupby(level=by, observed=True)[["n", "txn_sum", "rating_sum"]]
+        .sum()
+    )
+    return totals.assign(
+        avg_rating=totals["rating_sum"] / totals["n"] / RATING_STEPS,
+        avg_txn=totals["txn_sum"] / totals["n"],
+    )
 
 
-def build_narrative(df: pd.DataFrame, base_len: int, words):
+def rating_totals(summary: pd.DataFrame) -> pd.DataFrame:
+    """Count and mean spend per rating, indexed by the displayed rating.
+
+    There are only a handful of half-star codes, so np.bincount over them
+    beats setting up a groupby hash table.
+    """
+    codes = summary.index.get_level_values("Rating").to_numpy()
+    size = 5 * RATING_STEPS + 1
+    n = np.bincount(codes, weights=summary["n"].to_numpy(), minlength=size)
+    txn = np.bincount(codes, weights=summary["txn_sum"].to_numpy(), minlength=size)
+    present = np.flatnonzero(n)
+    return pd.DataFrame(
+        {"n": n[present].astype(int), "avg_txn": txn[present] / n[present]},
+        index=pd.Index(present / RATING_STEPS, name="Rating"),
+    )
+
+
+@st.cache_data
+def ratings_hist(summary: pd.DataFrame) -> pd.Series:
+    return rating_totals(summary)["n"]
+
+
+@st.cache_data
+def rating_spend(summary: pd.DataFrame) -> pd.DataFrame:
+    spend = rating_totals(summary)["avg_txn"].rename("Transaction Value")
+    return spend.reset_index()
+
+
+@st.cache_data
+def daily_trend(summary: pd.DataFrame) -> pd.DataFrame:
+    return rollup(summary, "Date")[["avg_rating", "avg_txn"]].reset_index()
+
+
+@st.cache_data
+def location_summary(summary: pd.DataFrame) -> pd.DataFrame:
+    """Per-location rating and spend, shared by the charts and the narrative."""
+    return rollup(summary, "Location")[["avg_rating", "avg_txn", "n"]].rename(
+        columns={"n": "count"}
+    )
+
+
+@st.cache_data
+def day_stats(summary: pd.DataFrame) -> pd.DataFrame:
+    return rollup(summary, "DayName")[["avg_rating", "avg_txn"]]
+
+
+@st.cache_data
+def build_narrative(
+    stats: pd.DataFrame,
+    n_records: int,
+    base_len: int,
+    words,
+    loc_summary: pd.DataFrame,
+    day_summary: pd.DataFrame,
+):
     """Create a 250-400 word narrative using filtered data plus overall context."""
     word_list = list(words)
-    avg_rating = df["Rating"].mean()
-    avg_txn = df["Transaction Value"].mean()
-    med_txn = df["Transaction Value"].median()
-
-    loc_summary = df.groupby("Location").agg(
-        avg_rating=("Rating", "mean"),
-        avg_txn=("Transaction Value", "mean"),
-        count=("Rating", "size"),
-    )
+    avg_rating = stats.at["mean", "Rating"] / RATING_STEPS
+    avg_txn = stats.at["mean", "Transaction Value"]
+    med_txn = stats.at["median", "Transaction Value"]
+
     loc_summary = loc_summary[loc_summary["count"] >= 5]
-    top_loc = loc_summary.sort_values("avg_rating", ascending=False).head(1)
-    bottom_loc = loc_summary.sort_values("avg_rating").head(1)
+    top_loc = loc_summary.nlargest(1, "avg_rating")
+    bottom_loc = loc_summary.nsmallest(1, "avg_rating")
 
     top_loc_text = (
         f"{top_loc.index[0]} (avg rating {top_loc.iloc[0]['avg_rating']:.2f})"
@@ -137,26 +314,26 @@ def build_narrative(df: pd.DataFrame, base_len: int, words):
         else "locations with enough samples"
     )
 
-    day_stats = df.groupby("DayName").agg(
-        avg_rating=("Rating", "mean"), avg_txn=("Transaction Value", "mean")
-    )
     busy_day = (
-        day_stats["avg_txn"].idxmax() if not day_stats.empty else "the busier days"
+        day_summary["avg_txn"].idxmax()
+        if not day_summary.empty
+        else "the busier days"
     )
 
     common_words = ", ".join(word_list[:6]) if word_list else "service, coffee"
 
     narrative_parts = [
-        f"This dashboard combines {len(df)} feedback records (out of {base_len} total). The filtered view currently shows an average rating of {avg_rating:.2f} out of 5 with mean spend of \\${avg_txn:.2f} and median spend of \\${med_txn:.2f}, anchoring both satisfaction and revenue outcomes for the same customers.",
+        f"This dashboard combines {n_records} feedback records (out of {base_len} total). The filtered view currently shows an average rating of {avg_rating:.2f} out of 5 with mean spend of \\${avg_txn:.2f} and median spend of \\${med_txn:.2f}, anchoring both satisfaction and revenue outcomes for the same customers.",
         f"Locations with enough feedback reveal variation worth attention: the current top performer on satisfaction is {top_loc_text}, while {bottom_loc_text} is the laggard. Ratings and spend move together modestly, suggesting experience improvements can drive ticket size. {busy_day} show the highest average ticket in this filtered view; scheduling stronger teams there could lift both throughput and sentiment.",
         f"Comments emphasise themes such as {common_words}. Positive clusters point to friendly staff and coffee quality, while repeat mentions of price or speed hint at friction moments. We also track rating distribution and spend by rating, plus daily trends to spot momentum rather than snapshots.",
         "\n\nAction points:\n\n1) Double down on the behaviours praised most (warm greetings, coffee consistency) via quick shift briefings.\n\n2) Where price or wait-time keywords appear, test a small set of value combos and speedier pickup flow on peak days.\n\n3) Use the downloads to share cleaned data with store managers, and revisit the charts weekly to check whether interventions are shifting ratings and average tickets in the right direction. Together these steps keep the dashboard actionable while making the most of the cleaned dataset."
     ]
 
     narrative = " ".join(narrative_parts)
-    words_count = len(narrative.split())
+    tokens = narrative.split()
+    words_count = len(tokens)
     if words_count > 400:
-        narrative = " ".join(narrative.split()[:400])
+        narrative = " ".join(tokens[:400])
     elif words_count < 250:
         filler = (
             " Additional context: Sustained focus on consistency, friendliness, and speedy pickup remains the most reliable lever for keeping ratings high and tickets healthy. "
@@ -166,32 +343,68 @@ def build_narrative(df: pd.DataFrame, base_len: int, words):
     return narrative
 
 
+def export_table(df: pd.DataFrame) -> pa.Table:
+    """Arrow table of the cleaned rows, with display ratings and plain dates."""
+    table = pa.Table.from_pandas(
+        df.assign(Rating=df["Rating"] / RATING_STEPS), preserve_index=False
+    )
+    for name, type_ in (
+        ("Transaction Date and Time", pa.timestamp("s")),
+        ("Date", pa.date32()),
+    ):
+        i = table.schema.get_field_index(name)
+        table = table.set_column(i, name, table[name].cast(type_))
+    return table
+
+
 @st.cache_data
-def to_csv_bytes(_df: pd.DataFrame):
-    return df.to_csv(index=False).encode("utf-8")
+def to_csv_bytes(df: pd.DataFrame):
+    buf = pa.BufferOutputStream()
+    pacsv.write_csv(
+        export_table(df), buf, pacsv.WriteOptions(quoting_style="needed")
+    )
+    return buf.getvalue().to_pybytes()
+
+
+@st.cache_data
+def to_parquet_bytes(df: pd.DataFrame):
+    buf = pa.BufferOutputStream()
+    pq.write_table(export_table(df), buf, compression="zstd")
+    return buf.getvalue().to_pybytes()
 
 
 # App layout ---------------------------------------------------------------
 st.title("Cafe Feedback Dashboard")
 df_full = load_data(DATA_FILE)
-df = df_full.copy()
+base_len = len(df_full)
+buckets = precompute(df_full[SUMMARY_KEYS + ["Transaction Value"]])
+date_range = None
 
-# Sidebar filters
+# Sidebar filters: build one boolean mask and slice df_full once at the end
 st.sidebar.header("Filters")
-locations = st.sidebar.multiselect(
-    "Select locations", sorted(df["Location"].unique())
-)
-if locations:
-    df = df[df["Location"].isin(locations)]
-
+# Category metadata is already unique; no scan of the column needed
+location_options = df_full["Location"].cat.categories.sort_values().tolist()
+locations = st.sidebar.multiselect("Select locations", location_options)
 rating_min, rating_max = st.sidebar.slider(
     "Rating range", 1.0, 5.0, (1.0, 5.0), 0.5
 )
-df = df[(df["Rating"] >= rating_min) & (df["Rating"] <= rating_max)]
+rating_codes = (rating_min * RATING_STEPS, rating_max * RATING_STEPS)
 
-if df["Transaction Date and Time"].notna().any():
-    min_date = df["Transaction Date and Time"].min().date()
-    max_date = df["Transaction Date and Time"].max().date()
+# Untouched widgets select every row of df_full, so masks are only built
+# (and df_full only sliced) for the filters that actually narrow the data.
+mask = None
+if (rating_min, rating_max) != (1.0, 5.0):
+    mask = df_full["Rating"].between(*rating_codes)
+if locations:
+    loc_mask = df_full["Location"].isin(locations)
+    mask = loc_mask if mask is None else mask & loc_mask
+
+timestamps = df_full["Transaction Date and Time"]
+if mask is not None:
+    timestamps = timestamps[mask]
+if timestamps.notna().any():
+    min_date = timestamps.min().date()
+    max_date = timestamps.max().date()
     chosen = st.sidebar.date_input(
         "Date range",
         value=(min_date, max_date),
@@ -200,11 +413,14 @@ if df["Transaction Date and Time"].notna().any():
     )
     if isinstance(chosen, (list, tuple)) and len(chosen) == 2:
         start, end = chosen
-        if isinstance(start, date) and isinstance(end, date):
-            df = df[
-                (df["Date"] >= start)
-                & (df["Date"] <= end)
-            ]
+        is_default = (start, end) == (min_date, max_date)
+        if isinstance(start, date) and isinstance(end, date) and not is_default:
+            date_range = (pd.Timestamp(start), pd.Timestamp(end))
+            date_mask = df_full["Date"].between(*date_range)
+            mask = date_mask if mask is None else mask & date_mask
+
+is_full = mask is None
+df = df_full if is_full else df_full.loc[mask]
 
 st.sidebar.download_button(
     "Download cleaned data (CSV)",
@@ -212,20 +428,28 @@ st.sidebar.download_button(
     file_name="clean_cafe_feedback.csv",
     mime="text/csv",
 )
+st.sidebar.download_button(
+    "Download cleaned data (Parquet)",
+    data=to_parquet_bytes(df),
+    file_name="clean_cafe_feedback.parquet",
+    mime="application/vnd.apache.parquet",
+)
 
 if df.empty:
     st.warning("No data after applying filters. Please broaden your selection.")
     st.stop()
 
-# KPI cards
+# KPI cards (the same stats feed the narrative)
+stats = df.agg({"Rating": "mean", "Transaction Value": ["mean", "median"]})
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("Records", f"{len(df):,}")
-c2.metric("Avg rating", f"{df['Rating'].mean():.2f}")
-c3.metric("Avg transaction", f"${df['Transaction Value'].mean():.2f}")
-c4.metric("Median transaction", f"${df['Transaction Value'].median():.2f}")
+c2.metric("Avg rating", f"{stats.at['mean', 'Rating'] / RATING_STEPS:.2f}")
+c3.metric("Avg transaction", f"${stats.at['mean', 'Transaction Value']:.2f}")
+c4.metric("Median transaction", f"${stats.at['median', 'Transaction Value']:.2f}")
 
-# Charts
-ratings_count = df["Rating"].value_counts().sort_index()
+# Charts (re-aggregated from the filtered buckets, not the raw rows)
+view = slice_summary(buckets, locations, rating_codes, date_range)
+ratings_count = ratings_hist(view)
 fig1 = px.bar(
     x=ratings_count.index.astype(str),
     y=ratings_count.values,
@@ -234,7 +458,7 @@ fig1 = px.bar(
 )
 st.plotly_chart(fig1, width='stretch')
 
-avg_val = df.groupby("Rating")["Transaction Value"].mean().reset_index()
+avg_val = rating_spend(view)
 fig2 = px.bar(
     avg_val,
     x="Rating",
@@ -245,12 +469,7 @@ fig2 = px.bar(
 st.plotly_chart(fig2, width='stretch')
 
 if df["Date"].notna().any():
-    daily = (
-        df.groupby("Date")
-        .agg(avg_rating=("Rating", "mean"), avg_txn=("Transaction Value", "mean"))
-        .reset_index()
-        .sort_values("Date")
-    )
+    daily = daily_trend(view)
     fig3 = px.line(
         daily,
         x="Date",
@@ -261,12 +480,10 @@ if df["Date"].notna().any():
     )
     st.plotly_chart(fig3, width='stretch')
 
+loc_summary = location_summary(view)
 top_loc = (
-    df.groupby("Location")
-    .agg(avg_rating=("Rating", "mean"), count=("Rating", "size"))
-    .query("count >= 5")
-    .sort_values("avg_rating", ascending=False)
-    .head(10)
+    loc_summary.query("count >= 5")
+    .nlargest(10, "avg_rating")
     .reset_index()
 )
 if not top_loc.empty:
@@ -292,5 +509,12 @@ if words:
 
 # Narrative summary (target 250-400 words)
 st.markdown("### AI-style summary and action points")
-summary = build_narrative(df, len(df_full), words)
+summary = build_narrative(
+    stats,
+    len(df),
+    base_len,
+    words,
+    loc_summary,
+    day_stats(view),
+)
 st.write(summary)